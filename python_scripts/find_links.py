@@ -1,17 +1,19 @@
 import sys
-import json
+import asyncio
+import orjson
 import os
 import re
-import base64
-import requests
-from huggingface_hub import InferenceClient
+import math
+import pybase64
+import hashlib
+from io import BytesIO
+import httpx
+import numpy as np
 from dotenv import load_dotenv
-from youtubesearchpython import VideosSearch
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import PydanticOutputParser
+from PIL import Image, ImageOps
+from diskcache import Cache
+from langchain_core.messages import HumanMessage
 from pydantic import BaseModel, Field
-from typing import Literal
 
 # Load environment variables
 load_dotenv()
@@ -31,54 +33,165 @@ text_model = ChatGoogleGenerativeAI(
     temperature=0.1
 )
 
+# SCHEMAS -----------------------------------------
+class op_schema(BaseModel) :
+    
+    valid : bool = Field(description=" True if the object in the image is a DIY doable project, else False.")
+    object_des : str = Field(description="overall identification & description of the object (for example : 'a crochet camera keychain' or 'an origami rabbit' or 'a valentine card with paper roses' etc... )")
+    specific_object : str = Field(description="The precise subject being represented (for example :, Red panda, Monstera plant, camera, any fruit, any card, heart etc.).")
+    material : str = Field(description="The core medium and crafting method (for example :, Amigurumi crochet, epoxy resin casting).")
+    context : str = Field(description="The physical format or function (for example : keychain, plushie, coaster, wall_hanging, a custom card, greeting card, love card etc, origami model etc.).")
+
+class final_op_schema(BaseModel) :
+    search_querry : str = Field(description="the final single line search query generated by you, using the provided data")
+
+# Used when several images are analysed in a single request
+class op_batch_schema(BaseModel) :
+    analyses : list[op_schema] = Field(description="one analysis per image, in the same order as the images")
+
+class final_op_batch_schema(BaseModel) :
+    search_querries : list[str] = Field(description="one final single line search query per object, in the same order as the provided data")
+
+# Structured runnables are built once per process and reused by every call,
+# instead of re-binding the schemas to the models on each invocation.
+structured_model1 = model.with_structured_output(op_schema)
+structured_text_model = text_model.with_structured_output(final_op_schema)
+structured_batch_model = model.with_structured_output(op_batch_schema)
+structured_batch_text_model = text_model.with_structured_output(final_op_batch_schema)
+
 #langchain part -------------------------
 
 # --- Configuration ---
 
-def encode_image_to_base64(image_url):
+# User-Agent header makes the request look like a real browser
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+DATA_URI_PREFIX = b"data:image/jpeg;base64,"
+
+# Longest side sent to the model; the vision encoder downsamples anything
+# larger anyway, so extra pixels only cost bandwidth and image tokens
+MAX_IMAGE_SIDE = 896
+# EXIF tag holding the camera orientation
+EXIF_ORIENTATION = 0x0112
+# Resized images are re-encoded as JPEG at this quality
+JPEG_QUALITY = 75
+# Downloads bigger than this are abandoned (the raw URL is sent instead)
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+# One async client shared by every download so concurrent fetches reuse
+# its connection pool; closed at the end of process().
+# Connections are kept alive between requests and HTTP/2 lets parallel
+# fetches to the same CDN / YouTube host share a single TLS connection.
+http_client = httpx.AsyncClient(
+    headers=HEADERS,
+    timeout=10,
+    follow_redirects=True,
+    http2=True,
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=30)
+)
+
+# YouTube's internal search endpoint (the one youtube.com itself calls), queried
+# directly through http_client so searches don't block the event loop
+YOUTUBE_SEARCH_URL = "https://www.youtube.com/youtubei/v1/search?prettyPrint=false"
+YOUTUBE_CLIENT_CONTEXT = {
+    "client": {
+        "clientName": "WEB",
+        "clientVersion": "2.20240726.00.00",
+        # english text keeps "views" / "years ago" parseable
+        "hl": "en",
+        "gl": "US"
+    }
+}
+
+# Every request spawns a fresh python process, so results are cached on disk.
+# The same pin gets hunted often; the image analysis barely changes with time
+# while YouTube rankings drift, hence the different TTLs.
+cache = Cache(os.getenv("LINK_HUNTER_CACHE_DIR", "/tmp/lh_cache"))
+QUERY_CACHE_TTL = 7 * 24 * 60 * 60   # 7 days
+YOUTUBE_CACHE_TTL = 60 * 60          # 1 hour
+
+def to_rgb(img):
+    """
+    Returns an upright RGB copy of img, ready to be saved as a JPEG: the EXIF
+    orientation is applied (phone photos would otherwise reach the model
+    sideways once the tag is dropped) and transparent pixels are flattened
+    onto white instead of the black RGB they usually carry.
+    """
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info:
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+def compress_image(image_data):
+    """
+    Shrinks the downloaded image to what the vision model actually looks at:
+    anything bigger than MAX_IMAGE_SIDE is downscaled and re-encoded as a JPEG
+    at JPEG_QUALITY, cutting both the upload and the image tokens billed.
+    Upright JPEGs that already fit are sent untouched, so they skip the re-encode.
+    Falls back to the original bytes if Pillow can't decode the image.
+    """
+    try:
+        # Image.open only parses the header here, the pixels are decoded lazily
+        with Image.open(BytesIO(image_data)) as img:
+            # Small JPEGs go out as downloaded, unless they depend on an EXIF
+            # rotation the model may ignore
+            upright = img.getexif().get(EXIF_ORIENTATION, 1) == 1
+            if img.format == 'JPEG' and upright and max(img.size) <= MAX_IMAGE_SIDE:
+                return bytes(image_data)
+
+            # For JPEGs, let the decoder downscale by a power of two while decoding
+            img.draft('RGB', (MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+            img = to_rgb(img)
+            img.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.LANCZOS)
+
+            buffer = BytesIO()
+            img.save(buffer, 'JPEG', quality=JPEG_QUALITY)
+            return buffer.getvalue()
+    except Exception as e:
+        print(f"Warning: could not re-encode image, sending it as is: {e}", file=sys.stderr)
+        return bytes(image_data)
+
+async def encode_image_to_base64(image_url):
     """
     Downloads the image locally and converts it to a Base64 data URI.
     This prevents the AI server from getting blocked by Pinterest/Google
     because the request comes from your local machine, not a cloud IP.
     """
     try:
-        # User-Agent header makes the request look like a real browser
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(image_url, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            # Convert binary content to base64 string
-            encoded_string = base64.b64encode(response.content).decode('utf-8')
-            # Create the data URI format required by APIs
-            return f"data:image/jpeg;base64,{encoded_string}"
-        else:
-            return None
+        # Stream the body into one growing buffer instead of holding the
+        # response object and its content as separate copies
+        async with http_client.stream("GET", image_url) as response:
+            if response.status_code != 200:
+                return None
+
+            image_data = bytearray()
+            async for chunk in response.aiter_bytes():
+                image_data += chunk
+                if len(image_data) > MAX_IMAGE_BYTES:
+                    print(f"Warning: image is larger than {MAX_IMAGE_BYTES} bytes, skipping download", file=sys.stderr)
+                    return None
+
+        # Decoding / resizing is CPU bound; Pillow releases the GIL while it
+        # works, so a worker thread lets several images be processed in
+        # parallel while the event loop keeps serving other downloads
+        payload = await asyncio.to_thread(compress_image, image_data)
+
+        # Build the data URI format required by APIs in one bytes buffer and
+        # decode it once (base64 output is plain ASCII). pybase64 uses a SIMD
+        # encoder, much faster than the stdlib one on multi-MB images
+        return (DATA_URI_PREFIX + pybase64.b64encode(payload)).decode('ascii')
     except Exception as e:
         print(f"Error downloading image for encoding: {e}", file=sys.stderr)
         return None
 
-def get_search_query_from_image(image_url):
-    """
-    Uses Gemma-4-31B-it to analyze the image and generate a precise search query.
-    """
-    if not GEMINI_API_KEY:
-        error_msg = {"error": "GEMINI_API_KEY is not found in the environment variables"}
-        print(json.dumps(error_msg), file=sys.stderr)
-        return None
-
-    # Step 1: Convert URL to Base64 to bypass blocking
-    base64_image_url = encode_image_to_base64(image_url)
-    
-    if not base64_image_url:
-        # Fallback: try sending the raw URL if encoding fails
-        print("Warning: Failed to encode image, sending raw URL...", file=sys.stderr)
-        base64_image_url = image_url
+# PROMPTS -----------------------------------------
 
-    # PROMPTS -----------------------------------------
-
-    prompt_text = """
+PROMPT_TEXT = """
         You are an expert Craft and DIY Analyst. Your objective is to meticulously analyze the provided image and deconstruct the handmade project within it. 
 
         First, determine if the primary subject is a genuine DIY/craft project. If it is a real-life subject (e.g., a real animal, landscape), a mass-produced electronic, a digital screenshot, or AI-generated art masquerading as a physical craft, flag it as invalid and state your reasoning.
@@ -92,156 +205,292 @@ def get_search_query_from_image(image_url):
         Strictly donot give conversational output, follow the format instructions
     """
 
+# Appended to PROMPT_TEXT when several images are analysed in one request
+BATCH_PROMPT_TEXT = """
+        You are given {count} images. Analyze each image independently, following the instructions above,
+        and return exactly one analysis per image, in the same order as the images were provided.
+    """
 
-    # SCHEMAS -----------------------------------------
-    class op_schema(BaseModel) :
-        
-        valid : bool = Field(description=" True if the object in the image is a DIY doable project, else False.")
-        object_des : str = Field(description="overall identification & description of the object (for example : 'a crochet camera keychain' or 'an origami rabbit' or 'a valentine card with paper roses' etc... )")
-        specific_object : str = Field(description="The precise subject being represented (for example :, Red panda, Monstera plant, camera, any fruit, any card, heart etc.).")
-        material : str = Field(description="The core medium and crafting method (for example :, Amigurumi crochet, epoxy resin casting).")
-        context : str = Field(description="The physical format or function (for example : keychain, plushie, coaster, wall_hanging, a custom card, greeting card, love card etc, origami model etc.).")
-
-    class final_op_schema(BaseModel) :
-        search_querry : str = Field(description="the final single line search query generated by you, using the provided data")
-
-
+SEARCH_TEXT = "You are an expert search query generator for finding best youtube tutorial of a given DIY object. Given the following precise structural analysis of a DIY project, create an Optimized Search Query.Use the data provided about the object & synthesize these details into a highly targeted, natural-sounding search query designed to find a step-by-step tutorial for this exact item on YouTube. Combine the elements logically into a fluid search phrase. Avoid awkward, purely robotic concatenations (e.g., instead of stitching words blindly, make it read like something a person would type, such as How to make a [Material] [Specific Object] [Form Factor]). End the phrase logically with 'tutorial' and only output a line line, just the optimized search query."
 
-    # MESSAGES -----------------------------------------
+def describe_analysis(result):
+    return f"{result.material}, {result.object_des}, {result.specific_object} & {result.context}"
 
-    user_message = HumanMessage(
+def image_message(prompt, base64_image_urls):
+    return HumanMessage(
         content=[
             {
                 "type": "text", 
-                "text": prompt_text,
-            },
+                "text": prompt,
+            }
+        ] + [
             {
                 "type": "image_url",
                 "image_url": {
                     "url": base64_image_url
                 }
             }
+            for base64_image_url in base64_image_urls
         ]
     )
 
-    structured_model1 = model.with_structured_output(op_schema)
-    result1 = structured_model1.invoke([user_message])
-
-    search_text = f"You are an expert search query generator for finding best youtube tutorial of a given DIY object. Given the following precise structural analysis of a DIY project, create an Optimized Search Query.Use the data provided about the object & synthesize these details into a highly targeted, natural-sounding search query designed to find a step-by-step tutorial for this exact item on YouTube. Combine the elements logically into a fluid search phrase. Avoid awkward, purely robotic concatenations (e.g., instead of stitching words blindly, make it read like something a person would type, such as How to make a [Material] [Specific Object] [Form Factor]). End the phrase logically with 'tutorial' and only output a line line, just the optimized search query. here is the data : {result1.material}, {result1.object_des}, {result1.specific_object} & {result1.context}"
-
-    final_msg = HumanMessage(
+def text_message(text):
+    return HumanMessage(
         content=[
             {
                 "type" : "text",
-                "text" : search_text
+                "text" : text
             }
         ]
     )
 
+def combine_results(result1, search_query):
+    # 1. Convert the Step 1 Pydantic object into a standard Python dictionary
+    combined_dict = result1.model_dump()
+    
+    # 2. Add the query string from Step 2 to our dictionary
+    combined_dict['search_query'] = search_query
+
+    # The output is now a single dictionary with all 5 keys: 
+    # valid, specific_object, material, context, and search_query
+    return combined_dict
+
+async def get_search_query_from_image(base64_image_url):
+    """
+    Uses Gemma-4-31B-it to analyze one (already downloaded) image and generate
+    a precise search query. Returns None if one of the models failed.
+    """
     try:
-        
-        structured_text_model = text_model.with_structured_output(final_op_schema)
-        final_result = structured_text_model.invoke([final_msg])
+        result1 = await structured_model1.ainvoke([image_message(PROMPT_TEXT, [base64_image_url])])
 
-        # 1. Convert the Step 1 Pydantic object into a standard Python dictionary
-        combined_dict = result1.model_dump()
-        
-        # 2. Extract the query string from Step 2 using dot notation 
-        # and add it to our dictionary
-        combined_dict['search_query'] = final_result.search_querry
+        search_text = f"{SEARCH_TEXT} here is the data : {describe_analysis(result1)}"
+        final_result = await structured_text_model.ainvoke([text_message(search_text)])
 
-        # The output is now a single dictionary with all 5 keys: 
-        # valid, specific_object, material, context, and search_query
-        return combined_dict
-        
     except Exception as e:
         print(f"Error calling one of the models: {e}", file=sys.stderr)
         return None
 
+    return combine_results(result1, final_result.search_querry)
+
+async def get_batched_search_queries(base64_image_urls):
+    """
+    Analyses all the images in a single Gemma-4-31B-it request and generates
+    all of their search queries in a single Gemini request, which saves one
+    round-trip (and the shared prompt) per extra image.
+    Raises if either model fails or returns the wrong number of items.
+    """
+    count = len(base64_image_urls)
+    prompt = PROMPT_TEXT + BATCH_PROMPT_TEXT.format(count=count)
+
+    analyses = (await structured_batch_model.ainvoke([image_message(prompt, base64_image_urls)])).analyses
+    if len(analyses) != count:
+        raise ValueError(f"expected {count} image analyses, got {len(analyses)}")
+
+    data = "\n".join(f"{n}. {describe_analysis(a)}" for n, a in enumerate(analyses, start=1))
+    search_text = f"{SEARCH_TEXT} Do this separately for each of the following {count} objects and return one search query per object, in the same order. here is the data :\n{data}"
+
+    search_queries = (await structured_batch_text_model.ainvoke([text_message(search_text)])).search_querries
+    if len(search_queries) != count:
+        raise ValueError(f"expected {count} search queries, got {len(search_queries)}")
+
+    return [combine_results(a, q) for a, q in zip(analyses, search_queries)]
+
+async def get_search_queries_from_images(image_urls):
+    """
+    Analyses every image URL that is not cached yet, batching them into one
+    request when there are several (see get_batched_search_queries).
+    If the batched request fails, each image is retried on its own so one bad
+    image doesn't fail the others.
+    Returns a list aligned with image_urls, with None for the images that failed.
+    """
+    if not GEMINI_API_KEY:
+        error_msg = {"error": "GEMINI_API_KEY is not found in the environment variables"}
+        print(orjson.dumps(error_msg).decode(), file=sys.stderr)
+        return [None] * len(image_urls)
+
+    def cache_key(url):
+        return "query:" + hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    # Duplicate URLs are looked up, downloaded and analysed only once
+    found = {}
+    pending = []
+    for url in dict.fromkeys(image_urls):
+        cached = cache.get(cache_key(url))
+        if cached is not None:
+            found[url] = cached
+        else:
+            pending.append(url)
+
+    if pending:
+        # Step 1: Convert URLs to Base64 to bypass blocking, all downloads at once
+        base64_image_urls = await asyncio.gather(*[encode_image_to_base64(url) for url in pending])
+
+        for n, url in enumerate(pending):
+            if not base64_image_urls[n]:
+                # Fallback: try sending the raw URL if encoding fails
+                print("Warning: Failed to encode image, sending raw URL...", file=sys.stderr)
+                base64_image_urls[n] = url
+
+        if len(pending) == 1:
+            combined = [await get_search_query_from_image(base64_image_urls[0])]
+        else:
+            try:
+                combined = await get_batched_search_queries(base64_image_urls)
+            except Exception as e:
+                print(f"Warning: batched model request failed ({e}), analysing the images one by one", file=sys.stderr)
+                combined = await asyncio.gather(*[get_search_query_from_image(b) for b in base64_image_urls])
+
+        for url, combined_dict in zip(pending, combined):
+            if combined_dict is not None:
+                cache.set(cache_key(url), combined_dict, expire=QUERY_CACHE_TTL)
+                found[url] = combined_dict
+
+    return [found.get(url) for url in image_urls]
+
 # ==== helper function to calculate and add scores to the links for better ranking=====
 
+# "3 years ago" -> ('3', 'year'); one compiled match replaces a search + substring scans
+TIME_RE = re.compile(r'(\d+)\s*(year|month|week|day|hour)', re.IGNORECASE)
+YEARS_PER_UNIT = {'year': 1, 'month': 1 / 12, 'week': 1 / 52, 'day': 1 / 365, 'hour': 1 / 8760}
+
 def parse_time_to_years(time_text):
-    if not time_text: return 0
-    time_text = time_text.lower()
-    
-    num_match = re.search(r'(\d+)', time_text)
-    if not num_match: return 0
-    number = int(num_match.group(1))
+    time_match = TIME_RE.search(time_text) if time_text else None
+    if not time_match: return 0
+    return int(time_match.group(1)) * YEARS_PER_UNIT[time_match.group(2).lower()]
 
-    if 'year' in time_text: return number
-    if 'month' in time_text: return number / 12
-    if 'week' in time_text: return number / 52
-    if 'day' in time_text: return number / 365
-    return 0
+# 1.2 ** years is computed as exp(years * ln(1.2)); the log is taken once here
+LOG_DECAY = math.log(1.2)
 
-def calculate_score(views, time_text):
+def calculate_scores(views, years):
     """
     UPDATED FORMULA: Score = (ViewsInMillions) / (1.2 ^ YearsOld)
     Example: 
     - 2.4M views, 0 years old -> Score = 2.4
     - 2.4M views, 2 years old -> Score = 2.4 / (1.2^2) = 1.66
+    Vectorized over NumPy arrays of raw views and ages in years, so a whole
+    result page is scored in one pass instead of row by row.
     """
-    years = parse_time_to_years(time_text)
-    if years < 0: years = 0
-    
-    # Convert raw views to Millions (float)
+    years = np.maximum(years, 0)
     views_in_millions = views / 1_000_000
-    
-    denominator = 1.2 ** years
-    
-    return round(views_in_millions / denominator, 3)
+    # 1 / 1.2^years == exp(-years * ln 1.2), a single vectorized exp
+    return np.round(views_in_millions * np.exp(-years * LOG_DECAY), 3)
+
+def top_k_indices(scores, k):
+    """
+    Indices of the k highest scores, highest first (ties keep their original
+    order, like a stable sort). np.partition finds the k-th best score in O(N);
+    only the rows scoring at least that much get sorted, instead of the whole page.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    # Every row tied with the k-th score is kept as a candidate, so which of
+    # them make the cut is decided by position below, not by argpartition
+    threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+    candidates = np.flatnonzero(scores >= threshold)
+    # lexsort's last key is the primary one: score descending, then position
+    return candidates[np.lexsort((candidates, -scores[candidates]))][:k]
 
 # --- Helper Functions (Search & Format) ---
 
 def format_view_count(views):
     if not isinstance(views, int): return "N/A"
-    try:
-        if views >= 1_000_000: return f"{views / 1_000_000:.1f}M"
-        elif views >= 1_000: return f"{views // 1000}k"
-        else: return str(views)
-    except: return "N/A"
+    # plain int arithmetic from here on, nothing that can raise
+    if views >= 1_000_000: return f"{views / 1_000_000:.1f}M"
+    if views >= 1_000: return f"{views // 1000}k"
+    return str(views)
     
+# Compiled once; view counts are parsed for every search result
+DIGITS_RE = re.compile(r'\d+')
+
 def get_raw_view_count(view_text):
     if not view_text or 'views' not in view_text.lower(): return 0
-    try:
-        num_str = ''.join(filter(str.isdigit, view_text))
-        return int(num_str) if num_str else 0
-    except: return 0
+    # "1,234,567 views" -> ['1', '234', '567'] -> 1234567
+    digit_groups = DIGITS_RE.findall(view_text)
+    return int(''.join(digit_groups)) if digit_groups else 0
 
-def search_youtube_links(query, limit=10):
-    try:
-        full_query = f"{query} tutorial"
-        
-        videos_search = VideosSearch(full_query, limit=20)
-        results = videos_search.result()['result']
+def text_of(field):
+    """Returns the plain text of a YouTube renderer text field ({simpleText} or {runs})."""
+    if not field: return ''
+    if 'simpleText' in field: return field['simpleText']
+    return ''.join(run.get('text', '') for run in field.get('runs', []))
 
-        tutorials = []
-        for video in results:
-            view_count_text = video.get('viewCount', {}).get('text', '0 views')
-            raw_views = get_raw_view_count(view_count_text)
+async def fetch_youtube_videos(query, limit=20):
+    """
+    Runs one YouTube search and returns up to `limit` videos in the same shape
+    youtubesearchpython used: title, link, viewCount.text and publishedTime.
+    """
+    response = await http_client.post(
+        YOUTUBE_SEARCH_URL,
+        json={"context": YOUTUBE_CLIENT_CONTEXT, "query": query}
+    )
+    response.raise_for_status()
+    data = orjson.loads(response.content)
+
+    sections = (data.get('contents', {})
+                    .get('twoColumnSearchResultsRenderer', {})
+                    .get('primaryContents', {})
+                    .get('sectionListRenderer', {})
+                    .get('contents', []))
+
+    videos = []
+    for section in sections:
+        for item in section.get('itemSectionRenderer', {}).get('contents', []):
+            renderer = item.get('videoRenderer')
+            if not renderer or 'videoId' not in renderer:
+                continue
+
+            videos.append({
+                "title": text_of(renderer.get('title')),
+                "link": f"https://www.youtube.com/watch?v={renderer['videoId']}",
+                "viewCount": {"text": text_of(renderer.get('viewCountText'))},
+                "publishedTime": text_of(renderer.get('publishedTimeText'))
+            })
+            if len(videos) >= limit:
+                return videos
 
-            time_text = video.get('publishedTime', '')
-            score = calculate_score(raw_views,time_text)
+    return videos
 
-            tutorials.append({
-                "title": video['title'],
-                "url": video['link'],
-                "product_name": query, 
-                "raw_views": raw_views,
-                "score" : score
-            })
-        
-        tutorials = sorted(tutorials, key=lambda x: x['score'], reverse=True)
+async def search_youtube_links(query, limit=10):
+    cache_key = ("youtube", query, limit)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        full_query = f"{query} tutorial"
         
-        """final_tutorials = []
-        for video in tutorials[:limit]:
-            final_tutorials.append({
-                "title": video['title'],
-                "url": video['url'],
-                "product_name": video['product_name'],
-                "formatted_views": format_view_count(video['raw_views'])
-            })"""
-            
+        results = await fetch_youtube_videos(full_query, limit=20)
+
+        # Parse every row once into parallel arrays and score them all together
+        views = np.array(
+            [get_raw_view_count(video.get('viewCount', {}).get('text', '0 views')) for video in results],
+            dtype=np.int64
+        )
+        years = np.array(
+            [parse_time_to_years(video.get('publishedTime', '')) for video in results],
+            dtype=np.float64
+        )
+        scores = calculate_scores(views, years)
+
+        # Only the top `limit` rows are turned back into dictionaries
+        top = top_k_indices(scores, limit)
+
+        tutorials = [
+            {
+                "title": results[i]['title'],
+                "url": results[i]['link'],
+                "product_name": query, 
+                "raw_views": int(views[i]),
+                "score" : float(scores[i])
+            }
+            for i in top
+        ]
+
+        # Empty results are not cached so a flaky search gets retried next time
+        if tutorials:
+            cache.set(cache_key, tutorials, expire=YOUTUBE_CACHE_TTL)
         return tutorials
 
     except Exception as e:
@@ -250,21 +499,31 @@ def search_youtube_links(query, limit=10):
 
 # --- Main Execution ---
 
-def main():
-    if len(sys.argv) < 2:
-        error_message = {"error": "No image URL provided."}
-        print(json.dumps(error_message), file=sys.stderr)
-        return
-    
-    image_url = sys.argv[1]
+def write_ndjson(record):
+    # One JSON document per line, flushed right away so the reader gets it now
+    sys.stdout.buffer.write(orjson.dumps(record) + b"\n")
+    sys.stdout.buffer.flush()
 
-    # Step 1: Get smart query via Base64 bypass
-    output_query = get_search_query_from_image(image_url)
+def stream_result(image_url, result):
+    """
+    NDJSON output: one line per tutorial, then a sentinel line carrying the
+    product keyword and "done": true once that image is finished.
+    """
+    for tutorial in result["tutorials"]:
+        write_ndjson(tutorial)
+    write_ndjson({"image_url": image_url, "product_keyword": result["product_keyword"], "done": True})
+
+async def process_image(image_url, output_query, on_result=None):
+    """
+    Runs the YouTube search for one analysed image URL and returns the output
+    dictionary, or None if no query could be generated for it.
+    on_result(image_url, result) is called as soon as this image is done.
+    """
 
     if not output_query:
-        error_message = {"error": "Could not generate a search query from the image."}
-        print(json.dumps(error_message), file=sys.stderr)
-        return
+        error_message = {"error": "Could not generate a search query from the image.", "image_url": image_url}
+        print(orjson.dumps(error_message).decode(), file=sys.stderr)
+        return None
     
     search_query = ""
     tutorials = []
@@ -274,18 +533,57 @@ def main():
 
         if valid is True :
             search_query = output_query["search_query"]
-            tutorials = search_youtube_links(search_query)
+            tutorials = await search_youtube_links(search_query)
             
     except Exception as e: 
         print(f"JSON Parse Error: {e}. Raw AI Output was: {output_query}", file=sys.stderr)
     
 
-    # Output JSON
-    final_output = {
+    result = {
         "product_keyword": output_query["object_des"], 
         "tutorials": tutorials
     }
-    print(json.dumps(final_output))
+    if on_result:
+        on_result(image_url, result)
+    return result
+
+async def process(image_urls, on_result=None):
+    try:
+        # Step 1: Get smart queries via Base64 bypass, one batched request for all images
+        output_queries = await get_search_queries_from_images(image_urls)
+
+        # Step 2: the searches for every image overlap instead of running back to back
+        return await asyncio.gather(*[
+            process_image(url, output_query, on_result) for url, output_query in zip(image_urls, output_queries)
+        ])
+    finally:
+        await http_client.aclose()
+
+def main():
+    # --ndjson streams each image's tutorials as soon as they are ranked
+    # instead of printing one JSON document at the very end
+    ndjson = "--ndjson" in sys.argv[1:]
+    image_urls = [arg for arg in sys.argv[1:] if arg != "--ndjson"]
+
+    if not image_urls:
+        error_message = {"error": "No image URL provided."}
+        print(orjson.dumps(error_message).decode(), file=sys.stderr)
+        return
+
+    if ndjson:
+        asyncio.run(process(image_urls, on_result=stream_result))
+        return
+
+    results = asyncio.run(process(image_urls))
+
+    # Output JSON
+    # A single image keeps the original object output; several images give a list
+    if len(image_urls) == 1:
+        if results[0] is None:
+            return
+        print(orjson.dumps(results[0]).decode())
+    else:
+        print(orjson.dumps([r for r in results if r is not None]).decode())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,5 +1,6 @@
 const express = require('express');
 const { spawn } = require('child_process');
+const readline = require('readline');
 const router = express.Router();
 
 //define the POST endpoint
@@ -20,15 +21,59 @@ router.post('/get-url', (req, res) => {
     // The first argument is 'python' or 'python3'
     // The second is an array containing the script path and any arguments
     const pythonExecutablePath = 'python3';
-    const Python_process = spawn(pythonExecutablePath, ['./python_scripts/find_links.py', imageUrl]);
-
-    let result_data = '';
+    // --ndjson makes the script print one JSON line per tutorial as soon as it is ranked,
+    // followed by a {"product_keyword": ..., "done": true} line
+    const Python_process = spawn(pythonExecutablePath, ['./python_scripts/find_links.py', '--ndjson', imageUrl]);
+
+    // clients that ask for NDJSON get every line forwarded as it arrives,
+    // everyone else still gets the single JSON object once the script is done
+    const streaming = (req.get('Accept') || '').includes('application/x-ndjson');
+
+    let product_keyword = null;
+    let sentinel_line = null;
+    let tutorials = [];
+    let parse_error = null;
     let error_data = '';
 
+    // every NDJSON response ends with exactly one "done" line: the script's own
+    // {"product_keyword": ..., "done": true} line when everything worked, or an
+    // {"error": ..., "done": true} line, so a cut-short stream is never mistaken for a complete one
+    const endStream = (last_line) => {
+        if (!res.headersSent) {
+            res.status(200).type('application/x-ndjson');
+        }
+        res.write(last_line + '\n');
+        res.end();
+    };
+
     // Listen for data coming from the Python script's standard output
-    //data arrives in chunks, that is why we keep adding the chunks to the result_data
-    Python_process.stdout.on('data', (data) => {
-        result_data += data.toString();
+    //readline splits the chunks back into complete lines, one JSON record each
+    const lines = readline.createInterface({ input: Python_process.stdout });
+
+    lines.on('line', (line) => {
+        if (!line.trim()) return;
+
+        try {
+            const record = JSON.parse(line);
+
+            if (record.done) {
+                // held back until the script has exited cleanly, see endStream
+                product_keyword = record.product_keyword;
+                sentinel_line = line;
+                return;
+            }
+            tutorials.push(record);
+        } catch (e) {
+            parse_error = e;
+            return;
+        }
+
+        if (streaming) {
+            if (!res.headersSent) {
+                res.status(200).type('application/x-ndjson');
+            }
+            res.write(line + '\n');
+        }
     });
 
     // Listen for any errors from the Python script
@@ -36,13 +81,15 @@ router.post('/get-url', (req, res) => {
         error_data += data.toString();
     });
 
-    //when the python script finishes, and all the data has been gathered,
-    //we can then convert it into a JSON format
+    //when the python script finishes, and all the lines have been read,
+    //we either close the stream or send the gathered results as one JSON object
     Python_process.on('close', (code) => {
         // FIX: Only fail if the exit code is NOT 0.
         // We ignore error_data if code is 0, because it often contains non-fatal warnings.
         if (code !== 0) {
             console.log(`Python script error : ${error_data}`);
+            // once streaming has started the status can't change anymore, report it in-band
+            if (res.headersSent) return endStream(JSON.stringify({ error: 'failed to process the image', done: true }));
             return res.status(500).json({error : 'failed to process the image', details: error_data});
         }
 
@@ -55,22 +102,34 @@ router.post('/get-url', (req, res) => {
 
             console.log("image processed successfully by the python script");
 
-            if (!result_data) {
+            if (parse_error) {
+                throw parse_error;
+            }
+
+            if (product_keyword === null) {
                 throw new Error("python script returned empty list");
             }
 
-            //parse the json script recieved from he python
-            const results = JSON.parse(result_data);
+            if (streaming) {
+                console.log(`streamed ${tutorials.length} results back to the extension`);
+                return endStream(sentinel_line);
+            }
+
+            const results = {
+                product_keyword: product_keyword,
+                tutorials: tutorials
+            };
             //send parse results back to extension
             console.log("sending the results back to the extension : ", results);
             res.json(results);
 
         } catch (e) {
             console.log("error parsing JSON from python script : ", e);
-            // If result_data is empty, it means Python finished but printed nothing.
+            // If nothing was parsed, it means Python finished but printed nothing.
             // In that case, the 'error_data' might actually be relevant.
             console.log("Stderr content was:", error_data);
             
+            if (res.headersSent) return endStream(JSON.stringify({ error: 'Failed to parse results from script.', done: true }));
             return res.status(500).json({ error: 'Failed to parse results from script.' }); 
         }
     });